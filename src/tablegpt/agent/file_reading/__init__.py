@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 import ast
+import asyncio
 import logging
-from ast import literal_eval
+import os
+import threading
+from collections import OrderedDict
 from enum import Enum
-from typing import TYPE_CHECKING, Literal
-from uuid import uuid4
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Literal
+from uuid import UUID, uuid4
 
 import pandas as pd
 from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
@@ -13,19 +17,15 @@ from langgraph.graph import END, START, MessagesState, StateGraph
 from langgraph.prebuilt import ToolNode
 from pybox.base import BasePyBoxManager  # noqa: TCH002
 
-from tablegpt.agent.file_reading.data_normalizer import (
-    get_data_normalize_chain,
-    get_table_reformat_chain,
-    wrap_normalize_code,
-)
 from tablegpt.errors import NoAttachmentsError
 from tablegpt.tools import IPythonTool, markdown_console_template
 from tablegpt.translation import create_translator
 
 if TYPE_CHECKING:
-    from pathlib import Path
+    from collections.abc import Hashable, Sequence
 
     from langchain_core.language_models import BaseLanguageModel
+    from langchain_core.runnables import Runnable, RunnableConfig
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +46,121 @@ class AgentState(MessagesState):
 
 
 ENCODER_INPUT_SEG_NUM = 2
+# Models with a table encoder expect the head of the dataset as an extra table part.
+ENCODER_MODEL_TYPES = frozenset({"mm-tabular/markup", "mm-tabular/contrastive"})
+
+RAW_TABLE_INFO_CACHE_SIZE = 128
+WORKFLOW_CACHE_SIZE = 32
+# Files larger than this (in bytes) are read with Arrow-backed dtypes.
+LARGE_FILE_SIZE = 100 * 1024 * 1024
+
+
+class _LRUCache:
+    """A minimal mapping that evicts the least recently used entry once it holds more than `maxsize` entries.
+
+    It is safe to share across threads, as workflows may be created from a thread pool.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+def _extract_filename(entry_message: BaseMessage) -> str:
+    """Extract the filename of the file attached to the entry message.
+
+    Raises:
+        NoAttachmentsError: If the message has no attachments.
+    """
+    if attachments := entry_message.additional_kwargs.get("attachments"):
+        # TODO: we only support one file for now
+        return attachments[0]["filename"]
+    raise NoAttachmentsError
+
+
+def _uuid4_pair() -> tuple[str, str]:
+    """Generate two random (version 4) UUID strings from a single read of the OS entropy source.
+
+    Used for the message id and tool call id of each `AIMessage`, which would otherwise call `uuid4()` twice.
+    """
+    random_bytes = os.urandom(32)
+    return str(UUID(bytes=random_bytes[:16], version=4)), str(UUID(bytes=random_bytes[16:], version=4))
+
+
+# Compiled file reading workflows, keyed by the arguments they were created with.
+_workflow_cache = _LRUCache(maxsize=WORKFLOW_CACHE_SIZE)
+
+# Sampled rows of the uploaded files, keyed by `(path, mtime_ns, size)` so that a modified file is read again.
+_raw_table_info_cache = _LRUCache(maxsize=RAW_TABLE_INFO_CACHE_SIZE)
+
+
+def _stat_local_file(filename: str, workdir: Path | None) -> tuple[Path, os.stat_result] | None:
+    """Locate an uploaded file from this process and stat it.
+
+    The file is resolved against `workdir` just like the kernel does; a relative filename without a `workdir`
+    depends on the kernel's working directory, which is unknown here.
+
+    Returns:
+        tuple[Path, os.stat_result] | None: The path and stat result of the file, or None if it cannot be located.
+    """
+    filepath = Path(filename) if workdir is None else Path(workdir, filename)
+    if not filepath.is_absolute():
+        return None
+    try:
+        return filepath, filepath.stat()
+    except OSError:
+        # The file may only be reachable from a remote kernel.
+        return None
+
+
+def _raw_table_info_cache_key(filename: str, workdir: Path | None) -> tuple[str, int, int] | None:
+    """Build the cache key of the raw table info of a file.
+
+    Returns None if the file cannot be located from this process, in which case the result should not be cached.
+    """
+    if (located := _stat_local_file(filename, workdir)) is None:
+        return None
+    filepath, stat = located
+    return str(filepath), stat.st_mtime_ns, stat.st_size
+
+
+def _read_df_code_template(filename: str, workdir: Path | None) -> str:
+    """Choose the code template for loading an uploaded file into a DataFrame.
+
+    Large delimited files are read with Arrow-backed dtypes, which store strings far more compactly than numpy
+    objects. The emitted code falls back to the default dtypes if pyarrow is missing in the kernel.
+    The size is only known if the file can be located from this process.
+    """
+    if Path(filename).suffix.lower() not in {".csv", ".tsv"}:
+        return READ_DF_CODE
+    located = _stat_local_file(filename, workdir)
+    if located is None or located[1].st_size <= LARGE_FILE_SIZE:
+        return READ_DF_CODE
+    return READ_LARGE_DF_CODE
 
 
 def create_file_reading_workflow(
@@ -82,42 +197,107 @@ def create_file_reading_workflow(
     if llm.metadata is not None:
         model_type = llm.metadata.get("model_type")
 
+    # Language models are not hashable, so they are keyed by identity. The cached entry keeps references to them,
+    # which guarantees that their ids are not reused by other objects while the entry lives.
+    cache_key = (
+        id(llm),
+        id(pybox_manager),
+        id(normalize_llm),
+        model_type,
+        workdir,
+        session_id,
+        nlines,
+        locale,
+        verbose,
+    )
+    if (cached := _workflow_cache.get(cache_key)) is not None:
+        return cached[-1]
+
+    workflow = _compile_file_reading_workflow(
+        llm,
+        pybox_manager,
+        workdir=workdir,
+        session_id=session_id,
+        nlines=nlines,
+        model_type=model_type,
+        normalize_llm=normalize_llm,
+        locale=locale,
+        verbose=verbose,
+    )
+    _workflow_cache.put(cache_key, (llm, pybox_manager, normalize_llm, workflow))
+    return workflow
+
+
+def _compile_file_reading_workflow(
+    llm: BaseLanguageModel,
+    pybox_manager: BasePyBoxManager,
+    *,
+    workdir: Path | None,
+    session_id: str | None,
+    nlines: int,
+    model_type: str | None,
+    normalize_llm: BaseLanguageModel | None,
+    locale: str | None,
+    verbose: bool,
+):
+    is_encoder_model = model_type in ENCODER_MODEL_TYPES
+
     translation_chain = None
     if locale is not None:
         translation_chain = create_translator(llm=llm)
+
+    # Build the normalization chains once, they are reused by every run of the workflow.
+    table_reformat_chain = None
+    normalize_chain = None
+    if normalize_llm is not None:
+        # Imported here as it is only needed when `normalize_llm` is provided.
+        from tablegpt.agent.file_reading.data_normalizer import (
+            get_data_normalize_chain,
+            get_table_reformat_chain,
+            needs_normalization,
+            wrap_normalize_code,
+        )
+
+        table_reformat_chain = get_table_reformat_chain(llm=normalize_llm)
+        normalize_chain = get_data_normalize_chain(llm=normalize_llm)
+
     ipython_tool = IPythonTool(pybox_manager=pybox_manager, cwd=workdir, session_id=session_id)
     tool_executor = ToolNode([ipython_tool])
 
     async def agent_node(state: AgentState) -> dict:
-        if state.get("processing_stage", Stage.UPLOADED) == Stage.UPLOADED:
-            return await get_df_info(state)
-        if state.get("processing_stage", Stage.UPLOADED) == Stage.INFO_READ:
-            return get_df_head(state)
-
-        return get_final_answer(state)
+        handler = stage_handlers.get(state.get("processing_stage", Stage.UPLOADED), get_final_answer)
+        return await handler(state)
 
     async def generate_normalization_code(state: AgentState) -> str:
-        if attachments := state["entry_message"].additional_kwargs.get("attachments"):
-            # TODO: we only support one file for now
-            filename = attachments[0]["filename"]
-        else:
-            raise NoAttachmentsError
+        filename = _extract_filename(state["entry_message"])
 
         var_name = state["entry_message"].additional_kwargs.get("var_name", "df")
 
-        # TODO: refactor the data normalization to langgraph
-        content = await ipython_tool.ainvoke(
-            input=RAW_TABLE_INFO_CODE.format_map({"filepath": filename, "var_name": f"{var_name}_5rows"})
-        )
-        raw_table_info = ast.literal_eval(next(x["text"] for x in content if x["type"] == "text"))
-        table_reformat_chain = get_table_reformat_chain(llm=normalize_llm)
+        # The sampled rows are not kept in the agent state: no later node reads them,
+        # and this cache already spares sampling the file again on a retry or a re-upload.
+        cache_key = _raw_table_info_cache_key(filename, workdir)
+        raw_table_info = _raw_table_info_cache.get(cache_key) if cache_key is not None else None
+        if raw_table_info is None:
+            # TODO: refactor the data normalization to langgraph
+            content = await ipython_tool.ainvoke(
+                input=RAW_TABLE_INFO_CODE.format_map({"filepath": filename, "var_name": f"{var_name}_5rows"})
+            )
+            raw_table_info = ast.literal_eval(next(x["text"] for x in content if x["type"] == "text"))
+            if cache_key is not None:
+                _raw_table_info_cache.put(cache_key, raw_table_info)
+
+        if not needs_normalization(raw_table_info):
+            return ""
+
         reformatted_table = await table_reformat_chain.ainvoke(input={"table": raw_table_info})
 
         # TODO: Replace pandas dependency with a lightweight alternative or custom implementation.
         if pd.DataFrame(reformatted_table).astype(str).equals(pd.DataFrame(raw_table_info)):
             return ""
 
-        normalize_chain = get_data_normalize_chain(llm=normalize_llm)
+        # The normalization prompt is built from `reformatted_table`, so this call has to wait for the reformat.
+        # Launching it speculatively against the raw table would never yield usable code: an identical reformat
+        # needs no normalization at all, and any other reformat invalidates the speculative result.
         normalization_code: str = await normalize_chain.ainvoke(
             input={
                 "table": raw_table_info,
@@ -128,51 +308,50 @@ def create_file_reading_workflow(
         return wrap_normalize_code(var_name, normalization_code)
 
     async def get_df_info(state: AgentState) -> dict:
-        if attachments := state["entry_message"].additional_kwargs.get("attachments"):
-            # TODO: we only support one file for now
-            filename = attachments[0]["filename"]
-        else:
-            raise NoAttachmentsError
+        filename = _extract_filename(state["entry_message"])
 
         var_name = state["entry_message"].additional_kwargs.get("var_name", "df")
 
-        thought = f"我已经收到您的数据文件，我需要查看文件内容以对数据集有一个初步的了解。首先我会读取数据到 `{var_name}` 变量中，并通过 `{var_name}.info` 查看 NaN 情况和数据类型。"  # noqa: RUF001
+        # Kick off the normalization first, so that its LLM round-trips overlap with the thought translation.
+        normalization_task = None
+        if normalize_llm is not None:
+            normalization_task = asyncio.create_task(generate_normalization_code(state))
+
+        thought = INFO_READ_THOUGHT.format(var_name=var_name)
         if translation_chain is not None:
-            thought = await translation_chain.ainvoke(input={"locale": locale, "input": thought})
+            try:
+                thought = await translation_chain.ainvoke(input={"locale": locale, "input": thought})
+            except BaseException:
+                if normalization_task is not None:
+                    normalization_task.cancel()
+                raise
 
-        read_df_code = f"""# Load the data into a DataFrame
-{var_name} = read_df('{filename}')"""
+        read_df_code = _read_df_code_template(filename, workdir).format(var_name=var_name, filename=filename)
 
         normalization_code = ""
-        if normalize_llm is not None:
+        if normalization_task is not None:
             try:
-                normalization_code = await generate_normalization_code(state)
+                normalization_code = await normalization_task
             except Exception as e:  # noqa: BLE001
                 logger.warning("Failed to generate normalization code: %s", str(e))
 
-        tool_input = f"""{read_df_code}
-{normalization_code}
-# Remove leading and trailing whitespaces in column names
-{var_name}.columns = {var_name}.columns.str.strip()
-
-# Remove rows and columns that contain only empty values
-{var_name} = {var_name}.dropna(how='all').dropna(axis=1, how='all')
-
-# Get the basic information of the dataset
-{var_name}.info(memory_usage=False)"""
+        tool_input = INFO_READ_CODE.format(
+            read_df_code=read_df_code, normalization_code=normalization_code, var_name=var_name
+        )
 
         content = f"{thought}\n```python\n{tool_input}\n```"
 
+        message_id, tool_call_id = _uuid4_pair()
         return {
             "messages": [
                 AIMessage(
-                    id=str(uuid4()),
+                    id=message_id,
                     content=content,
                     tool_calls=[
                         {
                             "name": "python",
                             "args": {"query": tool_input},
-                            "id": str(uuid4()),
+                            "id": tool_call_id,
                         }
                     ],
                     additional_kwargs={
@@ -189,44 +368,31 @@ def create_file_reading_workflow(
             "processing_stage": Stage.INFO_READ,
         }
 
-    def get_df_head(state: AgentState) -> dict:
+    async def get_df_head(state: AgentState) -> dict:
         var_name = state["entry_message"].additional_kwargs.get("var_name", "df")
 
-        thought = f"""接下来我将用 `{var_name}.head({nlines})` 来查看数据集的前 {nlines} 行。"""
+        thought = HEAD_READ_THOUGHT.format(var_name=var_name, nlines=nlines)
         if translation_chain is not None:
-            thought = translation_chain.invoke(input={"locale": locale, "input": thought})
+            thought = await translation_chain.ainvoke(input={"locale": locale, "input": thought})
 
         # The input visible to the LLM can prevent it from blindly imitating the actions of our encoder.
-        default_tool_input = f"""# Show the first {nlines} rows to understand the structure
-{var_name}.head({nlines})"""
-
-        # Use the flush parameter to force a refresh of the buffer and return it to multiple text parts
-        if model_type == "mm-tabular/markup":
-            tool_input = f"""# Show the first {nlines} rows to understand the structure
-print({var_name}.head({nlines}), flush=True)
-print({var_name}.head(500).to_markdown(), flush=True)"""
-
-        elif model_type == "mm-tabular/contrastive":
-            tool_input = f"""# Show the first {nlines} rows to understand the structure
-print({var_name}.head({nlines}), flush=True)
-print(str(inspect_df({var_name})), flush=True)"""
-
-        else:
-            tool_input = default_tool_input
+        default_tool_input = HEAD_READ_CODE.format(var_name=var_name, nlines=nlines)
+        tool_input = HEAD_READ_CODES.get(model_type, HEAD_READ_CODE).format(var_name=var_name, nlines=nlines)
 
         # The input visible to the LLM can prevent it from blindly imitating the actions of our encoder.
         content = f"{thought}\n```python\n{default_tool_input}\n```"
 
+        message_id, tool_call_id = _uuid4_pair()
         return {
             "messages": [
                 AIMessage(
-                    id=str(uuid4()),
+                    id=message_id,
                     content=content,
                     tool_calls=[
                         {
                             "name": "python",
                             "args": {"query": tool_input},
-                            "id": str(uuid4()),
+                            "id": tool_call_id,
                         }
                     ],
                     additional_kwargs={
@@ -243,17 +409,13 @@ print(str(inspect_df({var_name})), flush=True)"""
             "processing_stage": Stage.HEAD_READ,
         }
 
-    def get_final_answer(state: AgentState) -> dict:
-        if attachments := state["entry_message"].additional_kwargs.get("attachments"):
-            # TODO: we only support one file for now
-            filename = attachments[0]["filename"]
-        else:
-            raise NoAttachmentsError
+    async def get_final_answer(state: AgentState) -> dict:
+        filename = _extract_filename(state["entry_message"])
 
-        text = f"我已经了解了数据集 {filename} 的基本信息。请问我可以帮您做些什么？"  # noqa: RUF001
+        text = FINAL_ANSWER.format(filename=filename)
 
         if translation_chain is not None:
-            text = translation_chain.invoke(input={"locale": locale, "input": text})
+            text = await translation_chain.ainvoke(input={"locale": locale, "input": text})
 
         return {
             "messages": [
@@ -267,29 +429,38 @@ print(str(inspect_df({var_name})), flush=True)"""
             ]
         }
 
+    stage_handlers = {
+        Stage.UPLOADED: get_df_info,
+        Stage.INFO_READ: get_df_head,
+    }
+
     async def tool_node(state: AgentState) -> dict:
         messages: list[ToolMessage] = await tool_executor.ainvoke(state["messages"])
+        parent_id = state["parent_id"]
         for message in messages:
-            message.additional_kwargs = message.additional_kwargs | {
-                "parent_id": state["parent_id"],
-                # Hide the execution results of the file upload tool.
-                "display": False,
-            }
+            additional_kwargs = message.additional_kwargs
+            additional_kwargs["parent_id"] = parent_id
+            # Hide the execution results of the file upload tool.
+            additional_kwargs["display"] = False
             # TODO: this is very hard-coded to format encoder input like this.
-            if (
-                model_type in {"mm-tabular/markup", "mm-tabular/contrastive"}
-                and len(message.content) == ENCODER_INPUT_SEG_NUM
-            ):
+            if is_encoder_model and len(message.content) == ENCODER_INPUT_SEG_NUM:
                 _df_head, _extra = message.content
-                table_content = (
-                    [literal_eval(_extra["text"])] if model_type == "mm-tabular/contrastive" else [_extra["text"]]
-                )
-
+                if model_type == "mm-tabular/contrastive":
+                    # The table literal can be large, parse it off the event loop.
+                    table_content = [await asyncio.to_thread(ast.literal_eval, _extra["text"])]
+                else:
+                    table_content = [_extra["text"]]
+
+                # The extra part is replaced by the table, only the df head part is left to be formatted.
+                if isinstance(_df_head, dict) and _df_head.get("type") == "text":
+                    _df_head["text"] = markdown_console_template.format(res=_df_head["text"])
                 message.content = [
                     _df_head,
                     {"type": "table", "tables": table_content},
                 ]
-                message.additional_kwargs["hackfor"] = "encoder"
+                additional_kwargs["hackfor"] = "encoder"
+                continue
+
             for part in message.content:
                 if isinstance(part, dict) and part.get("type") == "text":
                     part["text"] = markdown_console_template.format(res=part["text"])
@@ -317,6 +488,92 @@ print(str(inspect_df({var_name})), flush=True)"""
     return workflow.compile(debug=verbose)
 
 
+async def abatch_read_files(
+    workflow: Runnable,
+    states: Sequence[AgentState],
+    *,
+    max_concurrency: int = 16,
+    config: RunnableConfig | None = None,
+) -> list[dict[str, Any]]:
+    """Run a file reading workflow over several uploads concurrently.
+
+    The kernel executions and LLM calls of different uploads interleave instead of running one upload after another.
+    This pays off the most when `normalize_llm` is set, as each upload waits on two normalization LLM round-trips.
+
+    Note that a compiled workflow is bound to a single `session_id`, so all uploads are read in the same kernel.
+    Each upload must therefore be loaded into its own variable, set by `var_name` in the entry message's
+    `additional_kwargs` (defaults to "df"), otherwise one upload could overwrite another one's DataFrame between
+    the steps of the workflow.
+
+    Args:
+        workflow (Runnable): The compiled workflow returned by `create_file_reading_workflow`.
+        states (Sequence[AgentState]): The input states, one per upload.
+        max_concurrency (int, optional): The maximum number of uploads processed at the same time, which bounds the
+            number of in-flight LLM calls. Defaults to 16.
+        config (RunnableConfig | None, optional): The config shared by all runs. Defaults to None.
+
+    Returns:
+        list[dict[str, Any]]: The output states, in the same order as `states`.
+
+    Raises:
+        ValueError: If several uploads would be loaded into the same variable.
+    """
+    var_names = [state["entry_message"].additional_kwargs.get("var_name", "df") for state in states]
+    if len(set(var_names)) != len(var_names):
+        msg = f"Uploads read in the same kernel must use distinct `var_name`s, got: {var_names}"
+        raise ValueError(msg)
+
+    return await workflow.abatch(list(states), config={**(config or {}), "max_concurrency": max_concurrency})
+
+
+INFO_READ_THOUGHT = "我已经收到您的数据文件，我需要查看文件内容以对数据集有一个初步的了解。首先我会读取数据到 `{var_name}` 变量中，并通过 `{var_name}.info` 查看 NaN 情况和数据类型。"  # noqa: RUF001
+
+READ_DF_CODE = """# Load the data into a DataFrame
+{var_name} = read_df('{filename}')"""
+
+READ_LARGE_DF_CODE = """# Load the data into a DataFrame, using Arrow-backed dtypes to reduce the memory usage if pyarrow is installed
+try:
+    {var_name} = read_df('{filename}', dtype_backend='pyarrow')
+except ImportError:
+    {var_name} = read_df('{filename}')"""
+
+INFO_READ_CODE = """{read_df_code}
+{normalization_code}
+# Remove leading and trailing whitespaces in column names
+{var_name}.columns = {var_name}.columns.str.strip()
+
+# Remove rows and columns that contain only empty values
+_notna = {var_name}.notna()
+{var_name} = {var_name}.loc[_notna.any(axis=1), _notna.any(axis=0)]
+del _notna
+
+# Get the basic information of the dataset
+{var_name}.info(memory_usage=False)"""
+
+HEAD_READ_THOUGHT = "接下来我将用 `{var_name}.head({nlines})` 来查看数据集的前 {nlines} 行。"
+
+HEAD_READ_CODE = """# Show the first {nlines} rows to understand the structure
+{var_name}.head({nlines})"""
+
+# Use the flush parameter to force a refresh of the buffer and return it to multiple text parts
+# The markdown table is printed in one call on purpose: `tool_node` expects exactly `ENCODER_INPUT_SEG_NUM` text
+# parts, and the encoder expects a single table. Printing it in row batches would split it into several parts.
+HEAD_READ_MARKUP_CODE = """# Show the first {nlines} rows to understand the structure
+print({var_name}.head({nlines}), flush=True)
+print({var_name}.head(500).to_markdown(), flush=True)"""
+
+HEAD_READ_CONTRASTIVE_CODE = """# Show the first {nlines} rows to understand the structure
+print({var_name}.head({nlines}), flush=True)
+print(str(inspect_df({var_name})), flush=True)"""
+
+# The actual code executed to read the head of the dataset, by model type.
+HEAD_READ_CODES = {
+    "mm-tabular/markup": HEAD_READ_MARKUP_CODE,
+    "mm-tabular/contrastive": HEAD_READ_CONTRASTIVE_CODE,
+}
+
+FINAL_ANSWER = "我已经了解了数据集 {filename} 的基本信息。请问我可以帮您做些什么？"  # noqa: RUF001
+
 RAW_TABLE_INFO_CODE = """import numpy as np
 from datetime import datetime
 
@@ -78,6 +78,30 @@ def is_split(origin: list[list[Any]], resp: list[list[Any]]) -> tuple[int, str]:
     return split_num, text
 
 
+def needs_normalization(raw_table_info: list[list[Any]]) -> bool:
+    """Cheaply check whether a table may benefit from normalization, before asking the LLM for it.
+    A table is considered already normalized if its first row looks like a
+    header: every cell is a non-empty string and no column name is repeated.
+    Tables with title rows, merged header cells (which are read as empty cells)
+    or repeated column names fail this check.
+
+    Args:
+        raw_table_info: A 2D array where each sublist represents a row from the table,
+        with each element in the sublist corresponding to a column value in that row.
+
+    Returns:
+        bool: True if the table should go through the normalization chains.
+    """
+    if len(raw_table_info) < MIN_ROWS:
+        # There is no data row to normalize.
+        return False
+
+    header = raw_table_info[0]
+    if not all(isinstance(cell, str) and cell.strip() for cell in header):
+        return True
+    return len(set(header)) != len(header)
+
+
 # region table reformat
 
 
@@ -5,6 +5,7 @@ from tablegpt.agent.file_reading.data_normalizer import (
     CodeOutputParser,
     ListListOutputParser,
     ListTupleOutputParser,
+    needs_normalization,
     wrap_normalize_code,
 )
 
@@ -347,5 +348,31 @@ except Exception as e:
         assert wrap_normalize_code(var_name, normalization_code).strip() == expected_output.strip()
 
 
+class TestNeedsNormalization(unittest.TestCase):
+    def test_normalized_table(self):
+        """Test a table with a plain header row."""
+        assert not needs_normalization([["name", "age"], ["Alice", "30"], ["Bob", None]])
+
+    def test_header_only(self):
+        """Test a table without any data row."""
+        assert not needs_normalization([["name", "age"]])
+
+    def test_title_row(self):
+        """Test a table with a title row on top of the header."""
+        assert needs_normalization([["Sales", None], ["name", "amount"], ["Alice", 30]])
+
+    def test_merged_header_cells(self):
+        """Test a table with merged header cells, which are read as empty cells."""
+        assert needs_normalization([["2023", "", "2024", ""], ["Q1", "Q2", "Q1", "Q2"], [1, 2, 3, 4]])
+
+    def test_non_string_header(self):
+        """Test a table whose first row contains data values."""
+        assert needs_normalization([["Alice", 30], ["Bob", 25]])
+
+    def test_duplicate_column_names(self):
+        """Test a table with repeated column names, as in horizontally split tables."""
+        assert needs_normalization([["name", "age", "name", "age"], ["Alice", 30, "Bob", 25]])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,423 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+import os
+import tempfile
+import unittest
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+from uuid import UUID
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from pybox.base import BasePyBoxManager
+from tablegpt.agent.file_reading import (
+    READ_DF_CODE,
+    READ_LARGE_DF_CODE,
+    Stage,
+    _extract_filename,
+    _LRUCache,
+    _raw_table_info_cache,
+    _raw_table_info_cache_key,
+    _read_df_code_template,
+    _uuid4_pair,
+    _workflow_cache,
+    abatch_read_files,
+    create_file_reading_workflow,
+    data_normalizer,
+)
+from tablegpt.errors import NoAttachmentsError
+from tablegpt.tools import IPythonTool, markdown_console_template
+
+
+async def echo_arun(self, query: str, run_manager=None):  # noqa: ARG001
+    """A stand-in for `IPythonTool._arun` that echoes the executed code back."""
+    return [{"type": "text", "text": query}], []
+
+
+async def two_parts_arun(self, query: str, run_manager=None):  # noqa: ARG001
+    """A stand-in for `IPythonTool._arun` that returns the df head and the table parts of the encoder models."""
+    return [{"type": "text", "text": "   a\n0  1"}, {"type": "text", "text": "[['a'], ['1']]"}], []
+
+
+class FakeKernel:
+    """A stand-in for the kernel behind `IPythonTool._arun`.
+
+    It answers the raw table info query with `raw_table_info`, echoes any other code back, and records every query.
+    """
+
+    def __init__(self, raw_table_info: list[list]) -> None:
+        self.raw_table_info = raw_table_info
+        self.queries: list[str] = []
+
+    @property
+    def raw_table_info_queries(self) -> list[str]:
+        return [query for query in self.queries if "nrows=5, header=None" in query]
+
+    async def sample(self) -> str:
+        return repr(self.raw_table_info)
+
+    async def arun(self, query: str, run_manager=None):  # noqa: ARG002
+        self.queries.append(query)
+        text = await self.sample() if "nrows=5, header=None" in query else query
+        return [{"type": "text", "text": text}], []
+
+
+def make_upload_state(filename: str, var_name: str | None = None) -> dict:
+    additional_kwargs = {"attachments": [{"filename": filename}]}
+    if var_name is not None:
+        additional_kwargs["var_name"] = var_name
+    message = HumanMessage(content="", additional_kwargs=additional_kwargs)
+    return {
+        "messages": [message],
+        "entry_message": message,
+        "parent_id": filename,
+        "processing_stage": Stage.UPLOADED,
+    }
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_get_missing_key(self):
+        cache = _LRUCache(maxsize=2)
+        assert cache.get("missing") is None
+
+    def test_evicts_least_recently_used(self):
+        cache = _LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        # Touch "a" so that "b" becomes the least recently used entry.
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+        assert len(cache) == 2  # noqa: PLR2004
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3  # noqa: PLR2004
+
+    def test_concurrent_get_and_put(self):
+        cache = _LRUCache(maxsize=1)
+
+        def worker(key: int) -> None:
+            for _ in range(1000):
+                cache.put(key, key)
+                assert cache.get(key) in (key, None)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for future in [executor.submit(worker, key) for key in range(4)]:
+                future.result()
+        assert len(cache) == 1
+
+
+class TestRawTableInfoCacheKey(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmpdir.name)
+        self.workdir.joinpath("data.csv").write_text("a,b\n1,2\n")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key_resolved_against_workdir(self):
+        key = _raw_table_info_cache_key("data.csv", self.workdir)
+        assert key is not None
+        assert key[0] == str(self.workdir / "data.csv")
+
+    def test_key_changes_with_mtime(self):
+        filepath = self.workdir / "data.csv"
+        key = _raw_table_info_cache_key("data.csv", self.workdir)
+        os.utime(filepath, ns=(0, 0))
+        assert _raw_table_info_cache_key("data.csv", self.workdir) != key
+
+    def test_missing_file(self):
+        assert _raw_table_info_cache_key("missing.csv", self.workdir) is None
+
+    def test_relative_path_without_workdir(self):
+        assert _raw_table_info_cache_key("data.csv", None) is None
+
+
+class TestExtractFilename(unittest.TestCase):
+    def test_first_attachment(self):
+        message = HumanMessage(
+            content="",
+            additional_kwargs={"attachments": [{"filename": "foo.csv"}, {"filename": "bar.csv"}]},
+        )
+        assert _extract_filename(message) == "foo.csv"
+
+    def test_no_attachments(self):
+        message = HumanMessage(content="", additional_kwargs={"attachments": []})
+        with self.assertRaises(NoAttachmentsError):  # noqa: PT027
+            _extract_filename(message)
+
+
+class TestCreateFileReadingWorkflow(unittest.TestCase):
+    def setUp(self):
+        self.llm = FakeListChatModel(responses=[])
+        self.pybox_manager = MagicMock(spec=BasePyBoxManager)
+
+    def test_reuse_compiled_workflow(self):
+        workflow = create_file_reading_workflow(self.llm, self.pybox_manager, session_id="session")
+        assert create_file_reading_workflow(self.llm, self.pybox_manager, session_id="session") is workflow
+
+    def test_distinct_arguments(self):
+        workflow = create_file_reading_workflow(self.llm, self.pybox_manager, nlines=5)
+        assert create_file_reading_workflow(self.llm, self.pybox_manager, nlines=10) is not workflow
+        other_llm = FakeListChatModel(responses=[])
+        assert create_file_reading_workflow(other_llm, self.pybox_manager, nlines=5) is not workflow
+
+    def test_model_type_change(self):
+        workflow = create_file_reading_workflow(self.llm, self.pybox_manager)
+        self.llm.metadata = {"model_type": "mm-tabular/markup"}
+        assert create_file_reading_workflow(self.llm, self.pybox_manager) is not workflow
+
+    def test_manager_released_once_evicted(self):
+        pybox_manager = MagicMock(spec=BasePyBoxManager)
+        manager_ref = weakref.ref(pybox_manager)
+        create_file_reading_workflow(self.llm, pybox_manager)
+        del pybox_manager
+        _workflow_cache.clear()
+        gc.collect()
+        assert manager_ref() is None
+
+
+class TestReadDfCodeTemplate(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmpdir.name)
+        for filename in ("data.csv", "data.xlsx"):
+            self.workdir.joinpath(filename).write_bytes(b"0" * 1024)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_small_file(self):
+        assert _read_df_code_template("data.csv", self.workdir) == READ_DF_CODE
+
+    @patch("tablegpt.agent.file_reading.LARGE_FILE_SIZE", 512)
+    def test_large_csv_file(self):
+        assert _read_df_code_template("data.csv", self.workdir) == READ_LARGE_DF_CODE
+
+    @patch("tablegpt.agent.file_reading.LARGE_FILE_SIZE", 512)
+    def test_large_excel_file(self):
+        assert _read_df_code_template("data.xlsx", self.workdir) == READ_DF_CODE
+
+    @patch("tablegpt.agent.file_reading.LARGE_FILE_SIZE", 512)
+    def test_unknown_size(self):
+        assert _read_df_code_template("missing.csv", self.workdir) == READ_DF_CODE
+
+    def test_large_file_code_falls_back_without_pyarrow(self):
+        def read_df(uri: str, **kwargs):
+            if kwargs.get("dtype_backend") == "pyarrow":
+                raise ImportError("pyarrow is required")
+            return uri
+
+        namespace = {"read_df": read_df}
+        exec(READ_LARGE_DF_CODE.format(var_name="df", filename="data.csv"), namespace)  # noqa: S102
+        assert namespace["df"] == "data.csv"
+
+
+class TestGetDfInfo(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmpdir.name)
+        self.workdir.joinpath("data.csv").write_bytes(b"0" * 1024)
+        self.workflow = create_file_reading_workflow(
+            FakeListChatModel(responses=[]), MagicMock(spec=BasePyBoxManager), workdir=self.workdir
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    async def read_info_code(self) -> str:
+        with patch.object(IPythonTool, "_arun", echo_arun):
+            output = await self.workflow.ainvoke(make_upload_state("data.csv"))
+        return output["messages"][1].tool_calls[0]["args"]["query"]
+
+    async def test_small_file(self):
+        tool_input = await self.read_info_code()
+        assert READ_DF_CODE.format(var_name="df", filename="data.csv") in tool_input
+        assert "dtype_backend" not in tool_input
+
+    @patch("tablegpt.agent.file_reading.LARGE_FILE_SIZE", 512)
+    async def test_large_file(self):
+        tool_input = await self.read_info_code()
+        assert tool_input.startswith(READ_LARGE_DF_CODE.format(var_name="df", filename="data.csv"))
+
+
+# A table whose first row already looks like a header.
+CLEAN_TABLE = [["region", "amount"], ["east", 1]]
+
+
+class TestNormalization(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.workdir = Path(self.tmpdir.name)
+        self.workdir.joinpath("data.csv").write_text("region,amount\neast,1\n")
+        _raw_table_info_cache.clear()
+
+    def tearDown(self):
+        _raw_table_info_cache.clear()
+        self.tmpdir.cleanup()
+
+    def create_workflow(self, normalize_llm: FakeListChatModel, **kwargs):
+        return create_file_reading_workflow(
+            FakeListChatModel(responses=[]),
+            MagicMock(spec=BasePyBoxManager),
+            workdir=self.workdir,
+            normalize_llm=normalize_llm,
+            **kwargs,
+        )
+
+    async def read_info_code(self, workflow, kernel: FakeKernel) -> str:
+        with patch.object(IPythonTool, "_arun", kernel.arun):
+            output = await workflow.ainvoke(make_upload_state("data.csv"))
+        return output["messages"][1].tool_calls[0]["args"]["query"]
+
+    async def test_raw_table_info_cached(self):
+        kernel = FakeKernel(CLEAN_TABLE)
+        workflow = self.create_workflow(FakeListChatModel(responses=[]))
+        await self.read_info_code(workflow, kernel)
+        await self.read_info_code(workflow, kernel)
+        assert len(kernel.raw_table_info_queries) == 1
+
+    async def test_clean_table_skips_llm(self):
+        kernel = FakeKernel(CLEAN_TABLE)
+        # One response more than the chains use, so that `i` does not wrap back to 0 after any call.
+        normalize_llm = FakeListChatModel(responses=["[['region', 'amount']]", "```python\nfinal_df = df\n```", ""])
+        workflow = self.create_workflow(normalize_llm)
+        tool_input = await self.read_info_code(workflow, kernel)
+        assert normalize_llm.i == 0
+        assert "# Normalize the data" not in tool_input
+
+    @patch.object(data_normalizer, "get_data_normalize_chain", wraps=data_normalizer.get_data_normalize_chain)
+    @patch.object(data_normalizer, "get_table_reformat_chain", wraps=data_normalizer.get_table_reformat_chain)
+    async def test_chains_built_once_per_workflow(self, get_table_reformat_chain, get_data_normalize_chain):
+        kernel = FakeKernel([["Sales report", None], ["region", "amount"], ["east", 1]])
+        normalize_llm = FakeListChatModel(
+            responses=["[['region', 'amount'], ['east', 1]]", "```python\nfinal_df = df.iloc[2:]\n```"]
+        )
+        workflow = self.create_workflow(normalize_llm)
+        for _ in range(2):
+            tool_input = await self.read_info_code(workflow, kernel)
+            assert "final_df = df.iloc[2:]" in tool_input
+        get_table_reformat_chain.assert_called_once()
+        get_data_normalize_chain.assert_called_once()
+
+    async def test_normalization_overlaps_translation(self):
+        kernel = FakeKernel(CLEAN_TABLE)
+        sampled = asyncio.Event()
+
+        async def sample() -> str:
+            sampled.set()
+            return repr(CLEAN_TABLE)
+
+        async def translate(input: dict) -> str:  # noqa: A002
+            # Only completes if the normalization started before the translation finished.
+            await asyncio.wait_for(sampled.wait(), timeout=1)
+            return input["input"]
+
+        kernel.sample = sample
+        with patch("tablegpt.agent.file_reading.create_translator", return_value=RunnableLambda(translate)):
+            workflow = self.create_workflow(FakeListChatModel(responses=[]), locale="zh-CN")
+        await self.read_info_code(workflow, kernel)
+        assert len(kernel.raw_table_info_queries) == 1
+
+    async def test_translation_failure_cancels_normalization(self):
+        kernel = FakeKernel(CLEAN_TABLE)
+        sampling = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def sample() -> str:
+            sampling.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return repr(CLEAN_TABLE)
+
+        async def translate(input: dict) -> str:  # noqa: A002, ARG001
+            await sampling.wait()
+            raise RuntimeError("translation failed")
+
+        kernel.sample = sample
+        with patch("tablegpt.agent.file_reading.create_translator", return_value=RunnableLambda(translate)):
+            workflow = self.create_workflow(FakeListChatModel(responses=[]), locale="zh-CN")
+        with self.assertRaises(RuntimeError):  # noqa: PT027
+            await self.read_info_code(workflow, kernel)
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+
+class TestUUID4Pair(unittest.TestCase):
+    def test_valid_distinct_uuid4(self):
+        first, second = _uuid4_pair()
+        assert first != second
+        for value in (first, second):
+            uuid = UUID(value)
+            assert uuid.version == 4  # noqa: PLR2004
+            assert str(uuid) == value
+
+
+class TestABatchReadFiles(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.workflow = create_file_reading_workflow(
+            FakeListChatModel(responses=[]), MagicMock(spec=BasePyBoxManager), session_id="batch-session"
+        )
+
+    async def test_duplicate_var_names(self):
+        states = [make_upload_state("a.csv"), make_upload_state("b.csv")]
+        with self.assertRaises(ValueError):  # noqa: PT027
+            await abatch_read_files(self.workflow, states)
+
+    @patch.object(IPythonTool, "_arun", echo_arun)
+    async def test_distinct_var_names(self):
+        states = [make_upload_state("a.csv", var_name="df_a"), make_upload_state("b.csv", var_name="df_b")]
+        outputs = await abatch_read_files(self.workflow, states, max_concurrency=2)
+        for output, filename, var_name in zip(outputs, ["a.csv", "b.csv"], ["df_a", "df_b"]):
+            tool_messages = [message for message in output["messages"] if isinstance(message, ToolMessage)]
+            assert f"{var_name} = read_df('{filename}')" in tool_messages[0].content[0]["text"]
+            assert f"{var_name}.head(5)" in tool_messages[1].content[0]["text"]
+            assert output["messages"][-1].additional_kwargs["parent_id"] == filename
+
+
+@patch.object(IPythonTool, "_arun", two_parts_arun)
+class TestToolNode(unittest.IsolatedAsyncioTestCase):
+    async def read_tool_messages(self, model_type: str | None) -> list[ToolMessage]:
+        llm = FakeListChatModel(responses=[], metadata={"model_type": model_type})
+        workflow = create_file_reading_workflow(llm, MagicMock(spec=BasePyBoxManager), session_id="tool-node")
+        output = await workflow.ainvoke(make_upload_state("data.csv"))
+        tool_messages = [message for message in output["messages"] if isinstance(message, ToolMessage)]
+        for message in tool_messages:
+            assert message.additional_kwargs["parent_id"] == "data.csv"
+            assert message.additional_kwargs["display"] is False
+        return tool_messages
+
+    async def test_markup_model(self):
+        for message in await self.read_tool_messages("mm-tabular/markup"):
+            assert message.content == [
+                {"type": "text", "text": markdown_console_template.format(res="   a\n0  1")},
+                {"type": "table", "tables": ["[['a'], ['1']]"]},
+            ]
+            assert message.additional_kwargs["hackfor"] == "encoder"
+
+    async def test_contrastive_model(self):
+        for message in await self.read_tool_messages("mm-tabular/contrastive"):
+            assert message.content == [
+                {"type": "text", "text": markdown_console_template.format(res="   a\n0  1")},
+                {"type": "table", "tables": [[["a"], ["1"]]]},
+            ]
+            assert message.additional_kwargs["hackfor"] == "encoder"
+
+    async def test_default_model(self):
+        for message in await self.read_tool_messages(None):
+            assert message.content == [
+                {"type": "text", "text": markdown_console_template.format(res="   a\n0  1")},
+                {"type": "text", "text": markdown_console_template.format(res="[['a'], ['1']]")},
+            ]
+            assert "hackfor" not in message.additional_kwargs
+
+
+if __name__ == "__main__":
+    unittest.main()